@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 # converter.py - AVIF Converter GUI (light theme, DnD optional, no extra window)
 
+from __future__ import annotations
+
+import functools
+import io
+import itertools
+import multiprocessing
 import os
+import queue
+import re
 import sys
 import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional, Set
 
 # Windows DPI awareness so the UI is not blurry
 try:
@@ -19,14 +28,46 @@ except Exception:
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image
 
-# AVIF plugin
-try:
-    import pillow_avif  # noqa: F401
-except Exception:
-    print("Install Pillow and pillow-avif-plugin: pip install pillow pillow-avif-plugin")
-    sys.exit(1)
+# Pillow and the AVIF plugin (which loads libavif/libaom) are slow to import,
+# so they are loaded on first use instead of before the window shows
+Image = None
+PIL_HINT = "Install Pillow and pillow-avif-plugin: pip install pillow pillow-avif-plugin"
+
+def ensure_pil():
+    global Image
+    if Image is None:
+        from PIL import Image as _Image
+        import pillow_avif  # noqa: F401
+        Image = _Image
+
+def prewarm_encoder():
+    # A throwaway encode loads and initializes libavif/libaom before the first real file
+    try:
+        ensure_pil()
+        Image.new("RGB", (16, 16)).save(io.BytesIO(), format="AVIF", quality=80, speed=10)
+    except Exception:
+        pass
+
+ENCODER_CODECS = ("aom", "svt", "rav1e")
+
+def available_codecs() -> Optional[List[str]]:
+    # Which AV1 encoders this libavif build was compiled with, or None if the plugin cannot tell
+    ensure_pil()
+    try:
+        from pillow_avif import _avif
+        return [c for c in ENCODER_CODECS if _avif.encoder_codec_available(c)]
+    except Exception:
+        return None
+
+def pick_codec(choice: str, speed: int, lossless: bool) -> Optional[str]:
+    # Returns None when the chosen encoder is known to be missing from this build
+    available = available_codecs()
+    if choice != "auto":
+        return choice if available is None or choice in available else None
+    # SVT-AV1 is much faster than libaom at the faster presets, but libavif cannot use it for lossless
+    use_svt = available and "svt" in available and speed >= 6 and not lossless
+    return "svt" if use_svt else "auto"
 
 def resource_path(rel: str) -> str:
     try:
@@ -47,45 +88,125 @@ except Exception:
     BaseTk = tk.Tk
 
 COMMON_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".gif"}
-
-def collect_images(src: Path, recursive: bool) -> List[Path]:
+# COMMON_EXTS as one regex, matched against bare file names in one C call
+COMMON_EXTS_RE = re.compile(r"(?:%s)\Z" % "|".join(re.escape(e) for e in sorted(COMMON_EXTS)), re.IGNORECASE)
+
+# Batches smaller than this are converted in-thread; process startup would cost more than it saves
+POOL_MIN_ITEMS = 3
+# Reported by the worker for files whose output is already up to date
+SKIPPED = "skipped"
+# Files submitted to the pool ahead of each worker
+PENDING_PER_WORKER = 4
+
+def collect_images(src: Path, recursive: bool) -> Iterator[Path]:
+    # Yields lazily so conversion can start while deep trees are still being walked
     if src.is_file():
-        return [src] if src.suffix.lower() in COMMON_EXTS else []
+        if src.suffix.lower() in COMMON_EXTS:
+            yield src
+        return
     if not src.is_dir():
-        return []
-    it = src.rglob("*") if recursive else src.glob("*")
-    return sorted([p for p in it if p.is_file() and p.suffix.lower() in COMMON_EXTS])
+        return
+    # scandir caches the file type in each entry, so the walk needs no extra stat calls
+    stack = [str(src)]
+    while stack:
+        files, dirs = [], []
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        # Symlinked files are followed like Path.is_file did; symlinked dirs are not, to avoid cycles
+                        if entry.is_file():
+                            if COMMON_EXTS_RE.search(entry.name):
+                                files.append(entry.path)
+                        elif recursive and entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        # Sorted per folder: files first, then subfolders in name order
+        for p in sorted(files):
+            yield Path(p)
+        stack.extend(sorted(dirs, reverse=True))
 
 def prepare_mode(im: Image.Image) -> Image.Image:
-    return im.convert("RGBA") if im.mode in ("RGBA", "LA") else im.convert("RGB")
-
-def save_avif(im: Image.Image, out_path: Path, quality: int, speed: int, lossless: bool, keep_exif: bool):
-    params = {"format": "AVIF", "quality": quality, "speed": speed, "lossless": lossless}
-    if keep_exif and "exif" in im.info:
-        params["exif"] = im.info["exif"]
-    if "icc_profile" in im.info:
-        params["icc_profile"] = im.info["icc_profile"]
-    im.save(out_path, **params)  # fixed: removed stray }
-
-def convert_one(src: Path, dst_dir: Path, overwrite: bool, quality: int, speed: int, lossless: bool, keep_exif: bool, prefix: Optional[str]) -> Optional[str]:
+    # Already encodable, skip the copy
+    if im.mode in ("RGB", "RGBA"):
+        return im
+    has_alpha = im.mode in ("LA", "PA") or (im.mode == "P" and "transparency" in im.info)
+    return im.convert("RGBA" if has_alpha else "RGB")
+
+def avif_params(quality: int, speed: int, lossless: bool, max_threads: int, codec: str) -> dict:
+    # autotiling lets the encoder split the frame into tiles it can encode on max_threads threads
+    return {"format": "AVIF", "quality": quality, "speed": speed, "lossless": lossless,
+            "autotiling": True, "range": "full", "max_threads": max_threads, "codec": codec}
+
+def save_avif(im: Image.Image, out_path: Path, base_params: dict, exif: Optional[bytes], icc: Optional[bytes]):
+    # base_params is shared by the whole batch; ** unpacking already copies it
+    meta = {}
+    if exif:
+        meta["exif"] = exif
+    if icc:
+        meta["icc_profile"] = icc
+    im.save(out_path, **base_params, **meta)
+
+def adaptive_speed(speed: int, pixels: int) -> int:
+    # Small images gain little from slow presets; large photos gain the most
+    mp = pixels / 1e6
+    if mp < 0.5:
+        return max(speed, 9)
+    if mp > 12 and speed >= 6:
+        return speed - 1
+    return speed
+
+def is_up_to_date(src: Path, out: Path) -> bool:
+    try:
+        return out.stat().st_mtime >= src.stat().st_mtime
+    except OSError:
+        return False
+
+def pick_output(src: Path, dst_dir: Path, prefix: Optional[str], overwrite: bool, existing: Set[str], claimed: Set[str]) -> Optional[Path]:
+    # existing is a snapshot of dst_dir names taken before the batch, so collisions need no stat calls;
+    # claimed collects the names this batch has already handed out.
+    # Returns None when a previous run already produced a newer output.
+    stem = f"{prefix}_{src.stem}" if prefix else src.stem
+    names = itertools.chain([f"{stem}.avif"], (f"{stem}_{n}.avif" for n in itertools.count(2)))
+    for name in names:
+        # Overwrite only applies to earlier outputs; two sources of one batch must never share a name,
+        # or two pool workers would write the same file at once
+        if name in claimed:
+            continue
+        if name in existing and not overwrite:
+            if not is_up_to_date(src, dst_dir / name):
+                continue
+            claimed.add(name)  # so another source with this stem moves on to the next suffix
+            return None
+        claimed.add(name)
+        return dst_dir / name
+
+def convert_one(src: Path, out: Path, params: dict, keep_exif: bool, max_dim: int = 0, adaptive: bool = False) -> Optional[str]:
+    ensure_pil()
     try:
-        with Image.open(src) as im:
-            im.load()
-            im2 = prepare_mode(im)
+        with Image.open(src) as src_im:
+            if max_dim and src_im.format == "JPEG":
+                # Let libjpeg scale down in the IDCT instead of decoding at full size
+                src_im.draft("RGB", (max_dim, max_dim))
+            im = prepare_mode(src_im)
+            im.load()  # convert() already loaded; this reads pixels when the mode was kept
+            if max_dim:
+                im.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+            # Read metadata after loading, PNG may store it after the image data
+            exif = src_im.info.get("exif") if keep_exif else None
+            icc = src_im.info.get("icc_profile")
+        del src_im  # free the decoded source before the encoder allocates its buffers
     except Exception as e:
         return f"Skip {src.name}: {e}"
-    stem = f"{prefix}_{src.stem}" if prefix else src.stem
-    out = dst_dir / f"{stem}.avif"
-    if out.exists() and not overwrite:
-        n = 2
-        while True:
-            cand = dst_dir / f"{stem}_{n}.avif"
-            if not cand.exists():
-                out = cand
-                break
-            n += 1
+    if adaptive:
+        speed = adaptive_speed(params["speed"], im.width * im.height)
+        if speed != params["speed"]:
+            params = {**params, "speed": speed}
     try:
-        save_avif(im2, out, quality, speed, lossless, keep_exif)
+        save_avif(im, out, params, exif, icc)
         return None
     except Exception as e:
         return f"Failed {src.name}: {e}"
@@ -118,13 +239,21 @@ class App(BaseTk):
         self.overwrite_var = tk.BooleanVar(value=False)
         self.keep_exif_var = tk.BooleanVar(value=True)
         self.lossless_var = tk.BooleanVar(value=False)
+        self.adaptive_var = tk.BooleanVar(value=True)
         self.quality_var = tk.IntVar(value=80)
-        self.speed_var = tk.IntVar(value=6)
+        self.speed_var = tk.IntVar(value=8)
+        self.threads_var = tk.IntVar(value=0)
+        self.codec_var = tk.StringVar(value="auto")
+        self.max_dim_var = tk.IntVar(value=0)
         self.prefix_var = tk.StringVar(value="")
         self.status_var = tk.StringVar(value="Idle")
+        self._running = False
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._stop = threading.Event()
 
         self._build_menu()
         self._build_ui()
+        threading.Thread(target=prewarm_encoder, daemon=True).start()
         self.bind("<Control-Return>", lambda e: self.start_conversion())
 
     def _build_menu(self):
@@ -163,17 +292,27 @@ class App(BaseTk):
         ttk.Checkbutton(left, text="Overwrite", variable=self.overwrite_var).pack(anchor="w")
         ttk.Checkbutton(left, text="Keep EXIF and ICC", variable=self.keep_exif_var).pack(anchor="w")
         ttk.Checkbutton(left, text="Lossless", variable=self.lossless_var).pack(anchor="w")
+        ttk.Checkbutton(left, text="Adapt speed to image size", variable=self.adaptive_var).pack(anchor="w")
 
         right = ttk.Frame(frm_opts); right.pack(side="left", fill="x", expand=True)
         r1 = ttk.Frame(right); r1.pack(fill="x", pady=2)
         ttk.Label(r1, text="Quality 0..100").pack(side="left")
         ttk.Spinbox(r1, from_=0, to=100, textvariable=self.quality_var, width=6).pack(side="left", padx=8)
         r2 = ttk.Frame(right); r2.pack(fill="x", pady=2)
-        ttk.Label(r2, text="Speed 0..10").pack(side="left")
+        ttk.Label(r2, text="Speed 0..10 (0-2 very slow)").pack(side="left")
         ttk.Spinbox(r2, from_=0, to=10, textvariable=self.speed_var, width=6).pack(side="left", padx=16)
         r3 = ttk.Frame(right); r3.pack(fill="x", pady=2)
-        ttk.Label(r3, text="Filename prefix").pack(side="left")
-        ttk.Entry(r3, textvariable=self.prefix_var, width=24).pack(side="left", padx=8)
+        ttk.Label(r3, text="Encoder threads (0 = auto)").pack(side="left")
+        ttk.Spinbox(r3, from_=0, to=64, textvariable=self.threads_var, width=6).pack(side="left", padx=8)
+        r4 = ttk.Frame(right); r4.pack(fill="x", pady=2)
+        ttk.Label(r4, text="Encoder").pack(side="left")
+        ttk.Combobox(r4, textvariable=self.codec_var, values=("auto",) + ENCODER_CODECS, state="readonly", width=8).pack(side="left", padx=8)
+        r5 = ttk.Frame(right); r5.pack(fill="x", pady=2)
+        ttk.Label(r5, text="Max dimension (0 = off)").pack(side="left")
+        ttk.Spinbox(r5, from_=0, to=16384, increment=64, textvariable=self.max_dim_var, width=6).pack(side="left", padx=8)
+        r6 = ttk.Frame(right); r6.pack(fill="x", pady=2)
+        ttk.Label(r6, text="Filename prefix").pack(side="left")
+        ttk.Entry(r6, textvariable=self.prefix_var, width=24).pack(side="left", padx=8)
 
         frm_prog = ttk.Frame(self); frm_prog.pack(fill="x", **pad)
         self.prog = ttk.Progressbar(frm_prog, mode="determinate"); self.prog.pack(fill="x")
@@ -223,6 +362,9 @@ class App(BaseTk):
 
     # Convert
     def start_conversion(self):
+        # Ctrl+Enter and the menu stay active while the button is disabled
+        if self._running:
+            return
         src = Path(self.src_var.get().strip()).expanduser()
         dst = Path(self.dst_var.get().strip()).expanduser()
         if not src.exists():
@@ -235,31 +377,183 @@ class App(BaseTk):
         overwrite = self.overwrite_var.get()
         keep_exif = self.keep_exif_var.get()
         lossless = self.lossless_var.get()
+        adaptive = self.adaptive_var.get()
         quality = int(self.quality_var.get())
         speed = int(self.speed_var.get())
+        threads = int(self.threads_var.get())
+        max_dim = max(0, int(self.max_dim_var.get()))
         prefix = self.prefix_var.get().strip() or None
 
-        items = collect_images(src, recursive=recursive)
-        if not items:
-            messagebox.showinfo("Nothing to do", "No supported images found"); return
-
-        self.btn_convert.config(state="disabled")
-        self.prog.config(value=0, maximum=len(items))
-        self.status_var.set(f"Converting {len(items)} file(s)...")
+        try:
+            ensure_pil()
+        except Exception:
+            messagebox.showerror("Error", PIL_HINT); return
 
-        def ui(fn, *a, **k): self.after(0, lambda: fn(*a, **k))
+        if self.codec_var.get() == "svt" and lossless:
+            messagebox.showerror("Error", "The svt encoder does not support lossless; pick aom or auto"); return
+        codec = pick_codec(self.codec_var.get(), speed, lossless)
+        if codec is None:
+            messagebox.showerror("Error", f"The {self.codec_var.get()} encoder is not available in this build"); return
 
+        self._running = True
+        self.btn_convert.config(state="disabled")
+        # Each batch reports through its own queue
+        progress_q: "queue.Queue[tuple]" = queue.Queue()
+        # The total is unknown until the walk finishes
+        self.prog.config(mode="indeterminate", value=0)
+        self.prog.start()
+        self.status_var.set("Scanning and converting...")
+
+        def jobs(items: Iterator[Path]):
+            existing = {e.name for e in os.scandir(dst)}
+            claimed: Set[str] = set()
+            for item in items:
+                if self._stop.is_set():
+                    return
+                yield item, pick_output(item, dst, prefix, overwrite, existing, claimed)
+
+        # The feeder below waits on the pool, so the total comes from a separate count-only walk
+        def count():
+            found = 0
+            for _ in collect_images(src, recursive=recursive):
+                if self._stop.is_set():
+                    return
+                found += 1
+                if found % 256 == 0:
+                    progress_q.put(("found", found))
+            progress_q.put(("walked", found))
+
+        def outcome(fut, item: Path) -> Optional[str]:
+            try:
+                return fut.result()
+            except Exception as e:
+                return f"Failed {item.name}: {e}"
+
+        def results(items: Iterator[Path], workers: int, base_params: dict):
+            do = functools.partial(convert_one, params=base_params, keep_exif=keep_exif, max_dim=max_dim, adaptive=adaptive)
+            if workers == 1:
+                for item, out in jobs(items):
+                    yield SKIPPED if out is None else do(item, out)
+                return
+            # AVIF encoding is CPU bound, so spread files across processes.
+            # Files are submitted as the walk finds them and reported as they finish.
+            # At most max_pending are in flight: enough to keep every worker busy,
+            # while the walk waits instead of queueing the whole tree.
+            max_pending = PENDING_PER_WORKER * workers
+            finished: "queue.Queue" = queue.Queue()
+            pending = {}
+
+            def drain(keep: int):
+                # Wait until at most `keep` files are in flight, then collect any others already done
+                while len(pending) > keep:
+                    fut = finished.get()
+                    yield outcome(fut, pending.pop(fut))
+                while True:
+                    try:
+                        fut = finished.get_nowait()
+                    except queue.Empty:
+                        return
+                    yield outcome(fut, pending.pop(fut))
+
+            # Kept on self so closing the window can cancel the batch
+            ex = self._pool = ProcessPoolExecutor(max_workers=workers)
+            try:
+                for item, out in jobs(items):
+                    if out is None:
+                        yield SKIPPED  # up to date, nothing to decode
+                        continue
+                    fut = ex.submit(do, item, out)
+                    pending[fut] = item
+                    fut.add_done_callback(finished.put)
+                    yield from drain(keep=max_pending - 1)
+                if not self._stop.is_set():
+                    yield from drain(keep=0)
+            finally:
+                self._pool = None
+                ex.shutdown(wait=not self._stop.is_set(), cancel_futures=True)
+
+        # Only the Tk thread touches widgets and variables; the worker reports through the queue
         def worker():
-            errors = 0
-            for i, item in enumerate(items, start=1):
-                msg = convert_one(item, dst, overwrite, quality, speed, lossless, keep_exif, prefix)
-                ui(self.prog.config, value=i)
-                if msg: errors += 1
-                ui(self.status_var.set, f"{i}/{len(items)}")
-            ui(self.status_var.set, f"Done. {len(items)-errors} succeeded, {errors} failed. Output: {dst}")
-            ui(self.btn_convert.config, state="normal")
-
+            failure = None
+            try:
+                # Peeked here rather than on the Tk thread, since listing a big folder takes a while
+                cores = os.cpu_count() or 1
+                items = collect_images(src, recursive=recursive)
+                # Enough of the walk to size the pool; never start more workers than files
+                head = list(itertools.islice(items, max(cores, POOL_MIN_ITEMS)))
+                if not head:
+                    return
+                workers = min(cores, len(head)) if len(head) >= POOL_MIN_ITEMS else 1
+                # Share the cores between pool workers so encoder threads do not oversubscribe them
+                base_params = avif_params(quality, speed, lossless, threads if threads > 0 else max(1, cores // workers), codec)
+                for msg in results(itertools.chain(head, items), workers, base_params):
+                    progress_q.put(("skipped", None) if msg is SKIPPED else ("file", msg))
+            except Exception as e:
+                failure = str(e)
+            finally:
+                progress_q.put(("done", failure))
+
+        threading.Thread(target=count, daemon=True).start()
         threading.Thread(target=worker, daemon=True).start()
+        self.after(100, self._drain_progress, progress_q, dst, 0, 0, 0, 0, None)
+
+    def destroy(self):
+        self._cancel_batch()
+        super().destroy()
+
+    def _cancel_batch(self):
+        # Without this, exit would wait for every file already submitted to the pool,
+        # and the worker processes would keep encoding with no window
+        self._stop.set()
+        pool = self._pool
+        if pool is None:
+            return
+        procs = list((pool._processes or {}).values())  # shutdown() forgets them
+        pool.shutdown(wait=False, cancel_futures=True)
+        for p in procs:
+            p.terminate()
+
+    def _drain_progress(self, progress_q: "queue.Queue[tuple]", dst: Path, done: int, errors: int, skipped: int, found: int, total: Optional[int]):
+        # Apply everything the worker queued since the last poll in one widget update
+        finished, failure = False, None
+        while True:
+            try:
+                kind, msg = progress_q.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "file":
+                done += 1
+                if msg: errors += 1
+            elif kind == "skipped":
+                done += 1
+                skipped += 1
+            elif kind == "found":
+                found = msg
+            elif kind == "walked":
+                total = msg
+                self.prog.stop()
+                self.prog.config(mode="determinate", maximum=max(total, 1))
+            elif kind == "done":
+                finished, failure = True, msg
+        if total is not None:
+            self.prog.config(value=done)
+        if not finished:
+            self.status_var.set(f"{done}/{total}" if total is not None else f"{done}/{max(done, found)}+ (scanning...)")
+            self.after(100, self._drain_progress, progress_q, dst, done, errors, skipped, found, total)
+            return
+        if total is None:  # failed before the walk completed
+            self.prog.stop()
+            self.prog.config(mode="determinate", value=0)
+        if failure:
+            self.status_var.set(f"Stopped after {done}/{total if total is not None else max(done, found)}: {failure}")
+        elif not done:
+            self.status_var.set("Idle")
+            messagebox.showinfo("Nothing to do", "No supported images found")
+        else:
+            self.status_var.set(f"Done. {done-errors-skipped} succeeded, {skipped} up to date, {errors} failed. Output: {dst}")
+        self.btn_convert.config(state="normal")
+        self._running = False
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # needed for the pool in PyInstaller builds
     App().mainloop()